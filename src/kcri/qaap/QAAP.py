@@ -4,11 +4,10 @@
 #
 
 import sys, os, argparse, json
+try: import orjson
+except ImportError: orjson = None
 from pico.workflow.logic import Workflow
-from pico.workflow.executor import Executor
-from pico.jobcontrol.subproc import SubprocessScheduler
-from .data import QAAPBlackboard, Platform
-from .services import SERVICES
+from .data import QAAPBlackboard, Platform, PLATFORMS
 from .workflow import DEPENDENCIES
 from .workflow import SystemTargets, UserTargets, Services, Params
 from .filescan import detect_filetype, scan_inputs, find_inputs, \
@@ -24,9 +23,12 @@ def err_exit(msg, *args):
     sys.exit(1)
 
 # Parse string to UserTarget or Service, else raise error
+# User targets take precedence over services with the same name
+TARGETS_AND_SERVICES = { **{ s.value: s for s in Services }, **{ t.value: t for t in UserTargets } }
 def UserTargetOrService(s):
-    try: return UserTargets(s)
-    except: return Services(s)
+    v = TARGETS_AND_SERVICES.get(s)
+    if v is None: raise ValueError(s)
+    return v
 
 # MAIN -------------------------------------------------------------------
 
@@ -121,22 +123,20 @@ per line, in a text file and pass this file with @FILENAME.
     # Parse targets and translate to workflow arguments
     targets = []
     try:
-        targets = list(map(lambda t: UserTargets(t.strip()), args.targets.split(',') if args.targets else []))
+        targets = [UserTargets(t.strip()) for t in args.targets.split(',')] if args.targets else []
     except ValueError as ve:
         err_exit('invalid target: %s (try --list-targets)', ve)
 
     # Parse excludes and translate to workflow arguments
     excludes = []
     try:
-        excludes = list(map(lambda t_or_s: UserTargetOrService(t_or_s.strip()), args.exclude.split(',') if args.exclude else []))
+        excludes = [UserTargetOrService(t_or_s.strip()) for t_or_s in args.exclude.split(',')] if args.exclude else []
     except ValueError as ve:
         err_exit('invalid exclude: %s (try --list-targets and --list-services)', ve)
 
     # Parse the platform option
-    platform = None
-    try:
-        platform = Platform(args.platform) if args.platform else None
-    except:
+    platform = PLATFORMS.get(args.platform) if args.platform else None
+    if args.platform and not platform:
         err_exit('invalid platform: %s, choose from: %s' % (args.platform, ', '.join(v.value for v in Platform)))
 
     # Parse and validate inputs into fastqs and fastas
@@ -147,10 +147,11 @@ per line, in a text file and pass this file with @FILENAME.
     fastas = dict()     # fasta files
     if len(args.inputs) == 1 and os.path.isdir(args.inputs[0]):
         inp_dir = args.inputs[0]
-        if os.path.isdir(os.path.join(inp_dir, 'Data','Intensities','BaseCalls')):
+        basecalls_dir = os.path.join(inp_dir, 'Data', 'Intensities', 'BaseCalls')
+        if os.path.isdir(basecalls_dir):
             if is_illumina_output_dir(inp_dir):
                 illumina_run_dir = os.path.abspath(inp_dir)
-            inp_dir = os.path.join(inp_dir, 'Data','Intensities','BaseCalls')
+            inp_dir = basecalls_dir
             il_fqs, pe_fqs, se_fqs, _ = find_inputs(inp_dir)
             if se_fqs: err_exit('cannot handle unpaired reads in Illumina run dir: %s' % inp_dir)
             elif pe_fqs: err_exit('QAAP autodetect broken: reads not identified as Illumina in: %s' % inp_dir)
@@ -246,6 +247,12 @@ per line, in a text file and pass this file with @FILENAME.
     # Now that path handling has been done we can safely change our PWD
     os.chdir(args.out_dir)
 
+    # Import the executor, scheduler and service shims only now, so that the
+    # --list options and input errors are handled without loading them
+    from pico.workflow.executor import Executor
+    from pico.jobcontrol.subproc import SubprocessScheduler
+    from .services import SERVICES
+
     # Set up the workflow executor and the batches
     scheduler = SubprocessScheduler(args.max_cpus, args.max_mem, args.max_time, args.poll, not args.verbose)
     executor = Executor(SERVICES, scheduler)
@@ -257,9 +264,17 @@ per line, in a text file and pass this file with @FILENAME.
     # DONE, mark the end of the run end on the blackboard
     blackboard.end_run()
 
-    # Dump the blackboard to the JSON results file
-    with open('qaap-results.json', 'w') as f_json:
-        json.dump(blackboard.as_dict(args.verbose), f_json)
+    # Dump the blackboard to the JSON results file, using orjson if we have it
+    # and it can encode the results (it raises TypeError where json coerces)
+    results = blackboard.as_dict(args.verbose)
+    try: data = orjson.dumps(results, option=orjson.OPT_NON_STR_KEYS) if orjson else None
+    except TypeError: data = None
+    if data is not None:
+        with open('qaap-results.json', 'wb') as f_json:
+            f_json.write(data)
+    else:
+        with open('qaap-results.json', 'w', buffering=128*1024) as f_json:
+            json.dump(results, f_json)
 
     # Write the qaap-summary.tsv (stub for now)
     with open('qaap-summary.tsv', 'w') as f_tsv:
@@ -269,8 +284,7 @@ per line, in a text file and pass this file with @FILENAME.
         print('#id\t' + '\t'.join(atts), file=f_tsv)
         for r in 'services/ReadsMetrics/results', 'services/CleanReadsMetrics/results', 'services/ContigsMetrics/results':
             for i, d in blackboard.get(r, dict()).items():
-                print(i, end='\t', file=f_tsv)
-                print('\t'.join(map(lambda a: str(d.get(a, 'NA')), atts)), file=f_tsv)
+                print(i, *(d.get(a, 'NA') for a in atts), sep='\t', file=f_tsv)
 
     # Done done
     return 0
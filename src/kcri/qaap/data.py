@@ -11,11 +11,29 @@ from pico.workflow.blackboard import Blackboard
 
 ### Constant Enums
 
-class Platform(enum.Enum):
+# Platform mixes in str so that members are stored and serialised as is
+class Platform(str, enum.Enum):
     MISEQ = 'MiSeq'
     NEXTSEQ = 'NextSeq'
     IGNORE = 'ignore'
 
+# Maps the platform values (as stored on the blackboard) to their members
+PLATFORMS = { p.value: p for p in Platform }
+
+# Default Trimmomatic adapter files for PE and SE reads, see Dockerfile
+DEFAULT_ADAPTERS = {
+    'PE': '/usr/src/ext/trimmomatic/adapters/default-PE.fa',
+    'SE': '/usr/src/ext/trimmomatic/adapters/default-SE.fa' }
+
+### Blackboard paths
+#
+#   The top level paths under which the QAAP keeps its run info, user inputs,
+#   and outputs.  Accessors below compose their keys from these.
+
+RUN_INFO = 'qaap/run_info'
+USER_INPUTS = 'qaap/user_inputs'
+QAAP_OUTPUTS = 'qaap/outputs'
+
 ### QAAPBlackboard class
 #
 #   Wraps the generic Blackboard with an API that adds getters and putters for
@@ -33,38 +51,58 @@ class QAAPBlackboard(Blackboard):
 
     def __init__(self, verbose=False):
         super().__init__(verbose)
+        self._cached_inputs = dict()  # see get_cached_input
+        self._adapters = dict()       # see get_trimmomatic_adapters
+        self._start_time = None       # set by start_run, used by end_run
+        self._rel_cache = dict()      # see relativise
+        self._made_dirs = set()       # see make_dir
 
     # QAAP-level methods
 
     def start_run(self, service, version, user_inputs):
-        self.put('qaap/run_info/service', service)
-        self.put('qaap/run_info/version', version)
-        self.put('qaap/run_info/time/start', datetime.now().isoformat(timespec='seconds'))
-        self.put('qaap/user_inputs', user_inputs)
+        self._start_time = datetime.now()
+        self.put(RUN_INFO, {
+            'service': service,
+            'version': version,
+            'time': { 'start': self._start_time.isoformat(timespec='seconds') } })
+        self.put(USER_INPUTS, user_inputs)
+        self._cached_inputs.clear()
+        self._rel_cache.clear()
 
     def end_run(self):
-        start_time = datetime.fromisoformat(self.get('qaap/run_info/time/start'))
+        start_time = self._start_time or datetime.fromisoformat(self.get(f'{RUN_INFO}/time/start'))
         end_time = datetime.now()
-        self.put('qaap/run_info/time/end', end_time.isoformat(timespec='seconds'))
-        self.put('qaap/run_info/time/duration', (end_time - start_time).total_seconds())
+        self.put(f'{RUN_INFO}/time/end', end_time.isoformat(timespec='seconds'))
+        self.put(f'{RUN_INFO}/time/duration', (end_time - start_time).total_seconds())
 
     def put_user_input(self, param, value):
-        return self.put('qaap/user_inputs/%s' % param, value)
+        self._cached_inputs.pop(param, None)
+        self._rel_cache.clear()
+        return self.put(f'{USER_INPUTS}/{param}', value)
 
     def get_user_input(self, param, default=None):
-        return self.get('qaap/user_inputs/%s' % param, default)
+        return self.get(f'{USER_INPUTS}/{param}', default)
+
+    def get_cached_input(self, param, default=None):
+        '''Like get_user_input, but for the flags that are queried by every
+           job, caches the value until it is put again.'''
+        try:
+            return self._cached_inputs[param]
+        except KeyError:
+            val = self._cached_inputs[param] = self.get_user_input(param, default)
+            return val
 
     def put_qaap_output(self, param, value):
         '''Put value as the output at param.'''
-        return self.put('qaap/outputs/%s' % param, value)
+        return self.put(f'{QAAP_OUTPUTS}/{param}', value)
 
     def add_qaap_output(self, param, value):
         '''Append value to the list of outputs at param.'''
-        return self.append_to('qaap/outputs/%s' % param, value)
+        return self.append_to(f'{QAAP_OUTPUTS}/{param}', value)
 
     def get_qaap_output(self, param, default=None):
         '''Return the value of output param.'''
-        return self.get('qaap/outputs/%s' % param, default)
+        return self.get(f'{QAAP_OUTPUTS}/{param}', default)
 
     def add_warning(self, warning):
         '''Stores a warning on the 'qaap' top level (note: use service.warning instead).'''
@@ -78,22 +116,25 @@ class QAAPBlackboard(Blackboard):
 
     def get_base_path(self):
         '''Return the absolute base/work/out dir, the initial path where we run.'''
-        path = self.get_user_input('out_dir')
+        path = self.get_cached_input('out_dir')
         if not path:
             raise Exception('base path (out_dir) is not set')
         return path
 
+    def make_dir(self, path):
+        '''Create directory path unless this blackboard already did, return path.'''
+        if path not in self._made_dirs:
+            os.makedirs(path, exist_ok = True)
+            self._made_dirs.add(path)
+        return path
+
     def get_inputs_dir(self):
         '''Return the directory with the symlinks to the inputs.'''
-        path = os.path.join(self.get_base_path(), 'inputs')
-        os.makedirs(path, exist_ok = True)
-        return path
+        return self.make_dir(os.path.join(self.get_base_path(), 'inputs'))
 
     def get_outputs_dir(self):
         '''Return the directory where the symlinks to the outputs go.'''
-        path = os.path.join(self.get_base_path(), 'outputs')
-        os.makedirs(path, exist_ok = True)
-        return path
+        return self.make_dir(os.path.join(self.get_base_path(), 'outputs'))
 
     def put_reference_path(self, path):
         '''Stores the path to the user provided reference genome.'''
@@ -117,22 +158,34 @@ class QAAPBlackboard(Blackboard):
         return self.get_user_input('cleaning_dbs', default)
 
     def put_platform(self, platform):
-        return self.put_user_input('platform', platform.value)
+        ret = self.put_user_input('platform', platform)
+        self._cached_inputs['platform'] = platform  # see get_platform
+        return ret
+
+    def get_platform(self):
+        '''Return the Platform member for the platform input, or None.  As
+           for get_cached_input, the member is cached until put again.'''
+        try:
+            return self._cached_inputs['platform']
+        except KeyError:
+            val = self.get_user_input('platform')
+            val = self._cached_inputs['platform'] = PLATFORMS.get(val)
+            return val
 
     def is_miseq(self):
-        return self.get_user_input('platform', None) == Platform.MISEQ.value
+        return self.get_platform() is Platform.MISEQ
 
     def is_nextseq(self):
-        return self.get_user_input('platform', None) == Platform.NEXTSEQ.value
+        return self.get_platform() is Platform.NEXTSEQ
 
     def is_metagenomic(self):
-        return self.get_user_input('metagenomic', False)
+        return self.get_cached_input('metagenomic', False)
 
     def is_amplicon(self):
-        return self.get_user_input('amplicon', False)
+        return self.get_cached_input('amplicon', False)
 
     def is_no_trim(self):
-        return self.get_user_input('no_trim', False)
+        return self.get_cached_input('no_trim', False)
 
     def get_trim_min_q(self):
         return self.get_user_input('tr_q', 20 if self.is_metagenomic() else 10)
@@ -144,13 +197,18 @@ class QAAPBlackboard(Blackboard):
         return self.get_user_input('tr_o', 6 if self.is_metagenomic() else 5)
 
     def get_trimmomatic_adapters(self, which):  # which is PE or SE
+        '''Return the adapter file for which, checked to exist only the
+           first time it is requested, as every sample requests it.'''
         bn = self.get_user_input('tr_a')
-        if not bn:
-            fn = '/usr/src/ext/trimmomatic/adapters/default-%s.fa' % which
-        else:
-            fn = '%s-%s.fa' % (bn, which)
-        if not os.path.isfile(fn):
-            raise Exception("trimmomatic adapter file not found: %s" % fn)
+        fn = self._adapters.get((bn, which))
+        if not fn:
+            if not bn:
+                fn = DEFAULT_ADAPTERS[which]
+            else:
+                fn = f'{bn}-{which}.fa'
+            if not os.path.isfile(fn):
+                raise Exception("trimmomatic adapter file not found: %s" % fn)
+            self._adapters[(bn, which)] = fn
         return fn
 
     # Helpers for creating the inputs and outputs symlinks
@@ -165,12 +223,19 @@ class QAAPBlackboard(Blackboard):
 
     def make_symlink(self, dst_dir, fn, sn):
         '''Create symlink in dst_dir to fn from sn, appending .gz if fn has .gz,
-           return the link path relative to the base directory.'''
+           return the link path relative to the base directory.  Only when the
+           link exists or dst_dir does not, do we unlink or makedirs and retry.'''
         link_fn = os.path.join(dst_dir, sn)
         if fn.endswith('.gz'): link_fn += '.gz'
-        if os.path.exists(link_fn): os.unlink(link_fn)
-        if not os.path.exists(dst_dir): os.makedirs(dst_dir)
-        os.symlink(os.path.relpath(fn, dst_dir), link_fn)
+        target = os.path.relpath(fn, dst_dir)
+        try:
+            os.symlink(target, link_fn)
+        except FileExistsError:
+            os.unlink(link_fn)
+            os.symlink(target, link_fn)
+        except FileNotFoundError:
+            os.makedirs(dst_dir, exist_ok=True)
+            os.symlink(target, link_fn)
         return os.path.relpath(link_fn, self.get_base_path())
 
     def symlink_input_pairs(self, dic):
@@ -205,16 +270,24 @@ class QAAPBlackboard(Blackboard):
     # Helpers to make links relative to base_dir relative to pwd
 
     @staticmethod
-    def _rel_rec(o,base): # recursive method
+    def _rel_rec(o,base): # recursive method, base must be absolute
         if not o: return o
-        if type(o) is str: return os.path.abspath(os.path.join(base,o))
-        if type(o) is list: return list(map(lambda i: QAAPBlackboard._rel_rec(i, base), o))
-        if type(o) is tuple: return tuple(map(lambda i: QAAPBlackboard._rel_rec(i, base), o))
-        if type(o) is dict: return dict((k, QAAPBlackboard._rel_rec(v,base)) for k,v in o.items())
-        raise Exception('missed case in _rel_rec: o is %s' % str(type(o)))
+        t = type(o)
+        if t is str: return os.path.join(base,o)
+        if t is dict: return { k: QAAPBlackboard._rel_rec(v,base) for k,v in o.items() }
+        if t is tuple or t is list: return t(QAAPBlackboard._rel_rec(i,base) for i in o)
+        raise Exception('missed case in _rel_rec: o is %s' % str(t))
 
     def relativise(self, obj):
-        return self._rel_rec(obj, self.get_base_path())
+        '''Return obj with its paths relative to base made absolute.  Memoised
+           per obj (held on to, so its id stays unique), as every service
+           execution asks for the same inputs.  Callers must not modify it.'''
+        if not obj: return obj
+        base = self.get_base_path()
+        hit = self._rel_cache.get((id(obj), base))
+        if hit is None:
+            hit = self._rel_cache[(id(obj), base)] = (obj, self._rel_rec(obj, base))
+        return hit[1]
 
     # Inputs: single_fqs, paired_fqs, fastas, illumina_run_dir
 
@@ -263,7 +336,7 @@ class QAAPBlackboard(Blackboard):
     def add_trimmed_pe_quad(self, fid, quad):
         '''Store the trimmed fastq quad (R1, R2, U1, U2), and make relative
            symlinks in the outputs dir pointing at the files.'''
-        self.put_qaap_output('trimmed_pe_fqs/%s' % fid, self.symlink_output_quad('trimmed', fid, quad))
+        self.put_qaap_output(f'trimmed_pe_fqs/{fid}', self.symlink_output_quad('trimmed', fid, quad))
 
     def get_trimmed_pe_quads(self, default=None):
         '''Return the dict with all trimmed pe quads.'''
@@ -271,7 +344,7 @@ class QAAPBlackboard(Blackboard):
 
     def add_trimmed_se_fq(self, fid, fq):
         '''Stores the trimmed se fq for fid and creates symlink under outputs.'''
-        self.put_qaap_output('trimmed_se_fqs/%s' % fid, self.symlink_output_file('trimmed', fid, fq, '.fq'))
+        self.put_qaap_output(f'trimmed_se_fqs/{fid}', self.symlink_output_file('trimmed', fid, fq, '.fq'))
 
     def get_trimmed_se_fqs(self, default=None):
         '''Return the dict with all trimmed se fastqs.'''
@@ -282,7 +355,7 @@ class QAAPBlackboard(Blackboard):
     def add_cleaned_pe_quad(self, fid, quad):
         '''Store the cleaned fastq PE quad (R1, R2, U1, U2), and make relative
            symlinks in the outputs dir pointing at the files.'''
-        self.put_qaap_output('cleaned_pe_fqs/%s' % fid, self.symlink_output_quad('cleaned', fid, quad))
+        self.put_qaap_output(f'cleaned_pe_fqs/{fid}', self.symlink_output_quad('cleaned', fid, quad))
 
     def get_cleaned_pe_quads(self, default=None):
         '''Return the dict with all cleaned pe quad.'''
@@ -290,7 +363,7 @@ class QAAPBlackboard(Blackboard):
 
     def add_cleaned_se_fq(self, fid, fq):
         '''Stores the cleaned SE fq for fid and creates symlink under outputs.'''
-        self.put_qaap_output('cleaned_se_fqs/%s' % fid, self.symlink_output_file('cleaned', fid, fq, '.fq'))
+        self.put_qaap_output(f'cleaned_se_fqs/{fid}', self.symlink_output_file('cleaned', fid, fq, '.fq'))
 
     def get_cleaned_se_fqs(self, default=None):
         '''Return the dict with all cleaned SE fastqs.'''
@@ -300,7 +373,7 @@ class QAAPBlackboard(Blackboard):
 
     def add_assembled_fasta(self, fid, fa):
         '''Store path to the assembly and make symlinks in the output dir.'''
-        self.put_qaap_output('assemblies/%s' % fid, self.symlink_output_file('assembled', fid, fa, '.fa'))
+        self.put_qaap_output(f'assemblies/{fid}', self.symlink_output_file('assembled', fid, fa, '.fa'))
 
     def get_assembled_fastas(self, default=None):
         '''Return the dict with all assembled contigs files.'''
@@ -2,24 +2,47 @@
 #
 # filescan.py - helper module to find FASTA and fastq files
 
-import sys, os, gzip, shutil, io, re
+import sys, os, gzip, zlib, shutil, re, functools
+from concurrent.futures import ThreadPoolExecutor
 
-# Regex patterns matching FASTA/Q file names and illumina read headers.
-# Note the question mark in (.*?) is to make the pattern non-greedy.
-GENERAL_PAT = re.compile('^(.*?)(\.f(q|astq|a|as|sa|na|asta))?(\.gz)?$')
-ILLUMINA_FILE_PAT = re.compile('^(.*?)_S[0-9]+_L[0-9]+_R[12]_[0-9]+\.fastq\.gz$')
-ILLUMINA_READ_PAT = re.compile(r'^@[^:]+:\d+:[^:]+:\d+:\d+:\d+:\d+ [12]:[YN]:\d+:[^:]+$')
+# Regex pattern matching Illumina file names (read headers: is_illumina_header).
+# Note the question mark in (.*?) is to make the pattern non-greedy, and that
+# the pattern is unanchored as it is only ever used with fullmatch.
+ILLUMINA_FILE_PAT = re.compile(r'(.*?)_S[0-9]+_L[0-9]+_R[12]_[0-9]+\.fastq\.gz')
+
+# Size of the file head that sniffing may read, and that we ask the kernel
+# to prefetch: the first gzip block, and hence the first record, fits in it.
+HEADER_BUFSIZE = 128 * 1024
+
+# Maximum number of threads to use for probing the contents of files.
+MAX_PROBE_THREADS = 8
+
+# File name extensions that settle the file type without opening the file.
+FASTQ_EXTS = ('.fq', '.fastq', '.fq.gz', '.fastq.gz')
+FASTA_EXTS = ('.fa', '.fas', '.fsa', '.fna', '.fasta', '.fa.gz', '.fas.gz', '.fsa.gz', '.fna.gz', '.fasta.gz')
+
+# Extensions stripped off file names to make sample names, see strip_extension.
+SEQ_EXTS = ('fq', 'fastq', 'fa', 'fas', 'fsa', 'fna', 'fasta')
 
 def err_exit(msg, *args):
     '''Exit with error message and non-zero code.'''
     print(('QAAP: %s' % msg) % args, file=sys.stderr)
     sys.exit(1)
 
+def probe_all(f, lst):
+    '''Return list of f applied to each item in lst.  Runs on a thread pool,
+       as probing files is I/O bound and zlib releases the GIL while inflating.'''
+    if len(lst) < 2: return list(map(f, lst))
+    with ThreadPoolExecutor(max_workers=min(MAX_PROBE_THREADS, len(lst))) as ex:
+        return list(ex.map(f, lst))
+
 def is_gzipped(fn):
     '''Return True iff fn is a gzipped file.'''
-    with open(fn, 'rb') as f:
-        b = f.peek(2)
-        return b[:2] == b'\x1f\x8b'
+    fd = os.open(fn, os.O_RDONLY)
+    try:
+        return os.read(fd, 2) == b'\x1f\x8b'
+    finally:
+        os.close(fd)
 
 def gunzip_file(src, dst):
     '''Unzip file src to file dst.'''
@@ -34,43 +57,92 @@ def gunzip_or_symlink(src, dst):
     else:
         os.symlink(src, dst)
 
-def detect_filetype(fn):
-    '''Detect whether file is (gzipped) fasta or fastq, or other.'''
-    with open(fn, 'rb') as f:
-        b = f.peek(2)
+def gunzip_head(read, n, raw=b''):
+    '''Return the first n bytes of the gzipped data starting with raw and
+       continuing with what read(size) returns, inflating no more than needed,
+       so sniffing does not pay for a full GzipFile and its buffers.'''
+    z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    b = b''
+    while len(b) < n and not z.eof:
+        if not raw: raw = read(512)
+        if not raw: break
+        b += z.decompress(raw, n - len(b))
+        raw = z.unconsumed_tail
+    return b
+
+def read_head(fn, n):
+    '''Return the first n bytes of file fn, gunzipped if it is gzipped.  Uses
+       a bare file descriptor as we read only a few hundred bytes at most.'''
+    fd = os.open(fn, os.O_RDONLY)
+    try:
+        if hasattr(os, 'posix_fadvise'):  # prefetch the head on Linux
+            os.posix_fadvise(fd, 0, HEADER_BUFSIZE, os.POSIX_FADV_WILLNEED)
+        b = os.read(fd, max(n, 512))
         if b[:2] == b'\x1f\x8b':
-            b = gzip.GzipFile(fileobj=f).peek(2)[:2]
-        c = chr(b[0]) if len(b) > 0 else '\x00'
+            return gunzip_head(functools.partial(os.read, fd), n, b)
+        return b[:n]
+    finally:
+        os.close(fd)
+
+@functools.lru_cache(maxsize=None)
+def detect_filetype(fn):
+    '''Detect whether file is (gzipped) fasta or fastq, or other.
+       Memoised, as the scan functions below probe each file repeatedly.'''
+    b = read_head(fn, 1)
+    c = chr(b[0]) if len(b) > 0 else '\x00'
     return 'fasta' if c == '>' else 'fastq' if c == '@' else 'other'
 
+def guess_filetype(fn):
+    '''Return the file type implied by the extension of fn, falling back
+       to detect_filetype for files with an unknown extension.'''
+    lfn = fn.lower()
+    if lfn.endswith(FASTQ_EXTS): return 'fastq'
+    if lfn.endswith(FASTA_EXTS): return 'fasta'
+    return detect_filetype(fn)
+
+def is_file(fn):
+    '''True iff fn is a regular file.  fn may be a path or an os.DirEntry,
+       in which case the file type obtained by scandir is used.'''
+    return fn.is_file() if isinstance(fn, os.DirEntry) else os.path.isfile(fn)
+
+def file_type(fn):
+    '''Return 'fasta', 'fastq' or 'other' for fn (path or os.DirEntry), where
+       anything that is not a readable regular file is 'other'.'''
+    try: return guess_filetype(os.fspath(fn)) if is_file(fn) else 'other'
+    except: return 'other'
+
 def is_fasta_file(fn):
-    '''True iff fn is a FASTA file.'''
-    try: return os.path.isfile(fn) and detect_filetype(fn) == 'fasta'
-    except: return False
+    '''True iff fn (path or os.DirEntry) is a FASTA file.'''
+    return file_type(fn) == 'fasta'
 
 def is_fastq_file(fn):
-    '''True iff fn is a FastQ file.'''
-    try: return os.path.isfile(fn) and detect_filetype(fn) == 'fastq'
-    except: return False
-
-def is_fastq_pair(fn1, fn2):
-    '''True iff fn1 and fn2 differ only in having a 1 vs 2 in their base name,
-       following one of R, r, _, -, ., or @.  Should cover most cases.'''
-    bn1, bn2 = map(os.path.basename, (fn1, fn2))
-    pfx = os.path.commonprefix([bn1, bn2])
-    sn1, sn2 = map(lambda s: s[len(pfx):], (bn1, bn2))
-    return sn1[0] == '1' and sn2[0] == '2' and sn1[1:] == sn2[1:] and (not pfx or pfx[-1] in 'Rr._-@')
+    '''True iff fn (path or os.DirEntry) is a FastQ file.'''
+    return file_type(fn) == 'fastq'
+
+def common_prefix_len(s1, s2):
+    '''Return the length of the common prefix of strings s1 and s2.'''
+    return next((i for i, (a, b) in enumerate(zip(s1, s2)) if a != b), min(len(s1), len(s2)))
+
+def is_illumina_header(line):
+    '''True iff line is an Illumina read header, that is it has the form
+       @instr:run:flowcell:lane:tile:x:y read:filtered:control:index.'''
+    if not line.startswith('@'):
+        return False
+    hdr, _, meta = line[1:].rstrip('\r\n').partition(' ')
+    a, b = hdr.split(':'), meta.split(':')
+    return len(a) == 7 and len(b) == 4 and \
+        a[0] != '' and a[2] != '' and b[3] != '' and \
+        all(map(str.isdigit, (a[1], a[3], a[4], a[5], a[6], b[2]))) and \
+        b[0] in ('1', '2') and b[1] in ('Y', 'N')
 
 def is_illumina_fastq(fn):
     '''True if either fn matches the illumina pattern, or the header is Illumina-like.'''
     bn = os.path.basename(fn)
-    if re.fullmatch(ILLUMINA_FILE_PAT, bn):
+    if ILLUMINA_FILE_PAT.fullmatch(bn):
         return True
     else:
-        with open(fn, 'rb') as f:
-            b = f.peek(2)
-            buf = io.TextIOWrapper(gzip.GzipFile(fileobj=f) if b[:2] == b'\x1f\x8b' else f)
-            return re.match(ILLUMINA_READ_PAT, buf.readline())
+        line = read_head(fn, 1024).split(b'\n', 1)[0]
+        return is_illumina_header(line.decode('latin-1'))
 
 def is_illumina_pair(fqs):
     '''True iff the file tuple is a pair of Illumina reads.'''
@@ -82,86 +154,115 @@ def is_illumina_output_dir(dname):
            os.path.isfile(os.path.join(dname, 'RunInfo.xml')) and \
            os.path.isfile(os.path.join(dname, 'runParameters.xml'))
 
-def iter_fastqs(fns):
-    '''Iterates arbitrary list of file names, returns fastq singletons and/or pairs.'''
-    prev = None
-    for this in sorted(filter(is_fastq_file, fns), key=os.path.basename):
-        if prev: # try for pair, if so return tuple prev, this 
-            if is_fastq_pair(prev, this):
-                yield (prev, this)
-                prev = None
-            else: # return the previous as singleton, hold this
-                yield prev
-                prev = this
-        else: # hold this to see if next pairs
-            prev = this
-    if prev: # return the last held as singleton
-        yield prev
+def mate_keys(bn):
+    '''Return list of (key, digit) for every 1 or 2 in base name bn that is at
+       its start or follows one of R, r, _, -, ., or @, right to left, where
+       key is bn with that digit masked out.'''
+    return [ (bn[:i] + '\0' + bn[i+1:], bn[i]) for i in range(len(bn) - 1, -1, -1)
+             if bn[i] in '12' and (i == 0 or bn[i-1] in 'Rr._-@') ]
+
+def iter_fastqs(fqs):
+    '''Iterates list of fastq file paths, returns fastq singletons and/or
+       pairs, in list order.  Mates have base names that differ only in a 1
+       vs 2 at one of their mate key positions.  Each file pairs on its
+       rightmost key that is shared by exactly one 1 and one 2, so any later
+       digits in the name are skipped, and files whose names sort between
+       two mates do not prevent pairing.'''
+    keys = { fq: mate_keys(os.path.basename(fq)) for fq in fqs }
+    mates = dict()
+    for fq, ks in keys.items():
+        for k, c in ks:
+            mates.setdefault(k, dict()).setdefault(c, list()).append(fq)
+    paired = dict()
+    for fq in fqs:
+        if fq in paired:
+            continue
+        for k, _ in keys[fq]:
+            r1s, r2s = mates[k].get('1', ()), mates[k].get('2', ())
+            if len(r1s) == 1 and len(r2s) == 1 and r1s[0] not in paired and r2s[0] not in paired:
+                paired[r1s[0]] = paired[r2s[0]] = (r1s[0], r2s[0])
+                break
+    for fq in fqs:
+        pr = paired.get(fq)
+        if not pr:
+            yield fq
+        elif pr[0] == fq:
+            yield pr
+
+def strip_extension(bn):
+    '''Return bn with its .gz suffix and/or FASTA/Q extension stripped off.'''
+    if bn.endswith('.gz'): bn = bn[:-3]
+    stem, dot, ext = bn.rpartition('.')
+    return stem if dot and ext in SEQ_EXTS else bn
 
 def make_sample_name(fn):
     '''Return base name for FASTA / singleton FASTQ, stripping extensions,
        and if illumina read, also everything from _S.'''
     bn = os.path.basename(fn)
-    mat = re.fullmatch(ILLUMINA_FILE_PAT, bn)
-    if not mat: mat = re.fullmatch(GENERAL_PAT, bn)
-    return mat.group(1) if mat else bn
+    mat = ILLUMINA_FILE_PAT.fullmatch(bn)
+    return mat.group(1) if mat else strip_extension(bn)
 
 def make_pair_name(fqpair):
     '''Return base name for FASTQ pair, stripping extensions and read indicator,
        and if illumina read, also everything from _S.'''
-    bn1, bn2 = map(os.path.basename, fqpair)
-    mat = re.fullmatch(ILLUMINA_FILE_PAT, bn1)
+    bn1 = os.path.basename(fqpair[0])
+    mat = ILLUMINA_FILE_PAT.fullmatch(bn1)
     if mat:
         return mat.group(1)
     else:
-        pfx = os.path.commonprefix([bn1, bn2])
+        pfx = bn1[:common_prefix_len(bn1, os.path.basename(fqpair[1]))]
         return pfx.rstrip('R').rstrip('._-@')
 
 def add_to_dict(d, k, v):
-    '''Add key, value to dict, erroring out if key already there.'''
-    if k in d:
+    '''Add key, value to dict, erroring out if key already there.  The size
+       check tells us whether setdefault added it, in a single lookup.'''
+    n = len(d)
+    d.setdefault(k, v)
+    if len(d) == n:
         err_exit('duplicate key: %s for values files %s and %s' % (k, v, d[k]))
-    else:
-        d[k] = v
 
-# Return all fastq files among list of file names as a three-tuple:
+# Return the fastq files in list of fastq paths fqs as a three-tuple:
 # - illumina_pairs, a dict sample_name -> (file_path_r1, file_path_r2)
 # - other_pairs, a dict sample_name -> (file_path_r1, file_path_r2)
 # - singles, a dict sample_name -> file_path
-def scan_fastqs(fns):
+def scan_fastqs(fqs):
     illums = dict()
     pairs = dict()
     singles = dict()
-    for it in iter_fastqs(fns):
-        if type(it) == tuple:
-            if is_illumina_pair(it):
-                add_to_dict(illums, make_pair_name(it), it)
-            else:
-                add_to_dict(pairs, make_pair_name(it), it)
-        else:
-            add_to_dict(singles, make_sample_name(it), it)
+    its = list(iter_fastqs(fqs))
+    prs = [it for it in its if type(it) == tuple]
+    for pr, is_il in zip(prs, probe_all(is_illumina_pair, prs)):
+        add_to_dict(illums if is_il else pairs, make_pair_name(pr), pr)
+    for fq in (it for it in its if type(it) != tuple):
+        add_to_dict(singles, make_sample_name(fq), fq)
     return (illums, pairs, singles)
 
-def scan_fastas(fns):
-    '''Return dict of fasta files among list of file name fns, keyed by sample name.'''
+def scan_fastas(fas):
+    '''Return dict of the fasta files in list of paths fas, keyed by sample name.'''
     fastas = dict()
-    for it in filter(is_fasta_file, fns):
-        add_to_dict(fastas, make_sample_name(it), os.path.abspath(it))
+    cwd = os.getcwd()  # abspath would call getcwd for every file
+    for it in fas:
+        add_to_dict(fastas, make_sample_name(it), os.path.normpath(os.path.join(cwd, it)))
     return fastas
 
-# Same as scan_fastqs, with fastas appended to the tuple.
+# Same as scan_fastqs, with fastas appended to the tuple, over any list or
+# iterator of file names or os.DirEntry objects, each classified just once.
 # When strict, every file name must be either fasta or fastq
 def scan_inputs(fns, strict=False):
-    lst = list(fns)  # put in list as fns may be iterator, and we need 2 passes
-    if strict: 
-        f = next(filter(lambda x: not is_fastq_file(x) and not is_fasta_file(x), lst), None)
-        if f: err_exit('invalid input: file is neither FASTA nor fastq: %s', f)
-    fqs = scan_fastqs(lst)
-    return (fqs[0], fqs[1], fqs[2], scan_fastas(fns))
-
-# Runs scan_inputs over the files in directory dname, see scan_inputs for retval
+    lst = list(fns)
+    fts = { 'fastq': list(), 'fasta': list(), 'other': list() }
+    for fn, ft in zip(lst, probe_all(file_type, lst)):
+        fts[ft].append(os.fspath(fn))
+    fts['fastq'].sort(key=os.path.basename)  # pairs and samples in name order
+    if strict and fts['other']:
+        err_exit('invalid input: file is neither FASTA nor fastq: %s', fts['other'][0])
+    fqs = scan_fastqs(fts['fastq'])
+    return (fqs[0], fqs[1], fqs[2], scan_fastas(fts['fasta']))
+
+# Runs scan_inputs over the files in directory dname, see scan_inputs for retval.
+# We pass the scandir entries on, so their cached file type spares a stat per file.
 def find_inputs(dname):
-    return scan_inputs(map(lambda de: de.path, filter(lambda de: de.is_file, os.scandir(dname))))
+    return scan_inputs(os.scandir(dname))
 
 # Checks that path is a proper screen/clean database, returns basename, path or errors out
 def check_screen_db(path):
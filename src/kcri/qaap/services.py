@@ -26,20 +26,25 @@ from .shims.Trimmomatic import TrimmomaticShim
 from .shims.Unicycler import UnicyclerShim
 from .shims.base import UnimplementedService
 
+# The shims are stateless, so those serving several services are shared
+fastqc_shim = FastQCShim()
+fastqscreen_shim = FastQScreenShim()
+readsmetrics_shim = ReadsMetricsShim()
+
 SERVICES = {
     Services.CONTIGSMETRICS:       ContigsMetricsShim(),
-    Services.FASTQC:               FastQCShim(),
-    Services.FASTQSCREEN:          FastQScreenShim(),
+    Services.FASTQC:               fastqc_shim,
+    Services.FASTQSCREEN:          fastqscreen_shim,
     Services.INTEROP:              InterOpShim(),
     Services.KNEADDATA:            KneadDataShim(),
     Services.MULTIQC:              MultiQCShim(),
     Services.QUAST:                QuastShim(),
-    Services.CLEAN_FASTQC:         FastQCShim(),       # Same shim as plain
-    Services.CLEAN_FASTQSCREEN:    FastQScreenShim(),  # 
-    Services.CLEAN_READSMETRICS:   ReadsMetricsShim(), # 
-    Services.TRIMMED_FASTQC:       FastQCShim(),       # Same shim as plain
-    Services.TRIMMED_READSMETRICS: ReadsMetricsShim(), # 
-    Services.READSMETRICS:         ReadsMetricsShim(),
+    Services.CLEAN_FASTQC:         fastqc_shim,        # Same shim as plain
+    Services.CLEAN_FASTQSCREEN:    fastqscreen_shim,   # 
+    Services.CLEAN_READSMETRICS:   readsmetrics_shim,  # 
+    Services.TRIMMED_FASTQC:       fastqc_shim,        # Same shim as plain
+    Services.TRIMMED_READSMETRICS: readsmetrics_shim,  # 
+    Services.READSMETRICS:         readsmetrics_shim,
     Services.SKESA:                SKESAShim(),
     Services.SPADES:               SPAdesShim(),
     Services.TRIMGALORE:           TrimGaloreShim(),
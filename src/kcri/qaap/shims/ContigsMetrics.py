@@ -3,11 +3,12 @@
 # kcri.qaap.shims.ContigsMetrics - service shim to the uf-stats backend
 #
 
-import os, logging
+import os, logging, shlex
 from pico.workflow.executor import Task
 from pico.jobcontrol.job import JobSpec, Job
 from .base import MultiJobExecution, UserException
 from .versions import DEPS_VERSIONS
+from ..filescan import is_gzipped
 
 # Our service name and current backend version
 SERVICE, VERSION = "ContigsMetrics", DEPS_VERSIONS['unfasta']
@@ -48,24 +49,61 @@ class ContigsMetricsShim:
 # Single execution of the service
 class ContigsMetricsExecution(MultiJobExecution):
     '''The single execution of service sid in workflow execution _xid (None).
-       Schedules a job for every fasta file in the xid.'''
+       Spreads the fasta files over as many jobs as can run in parallel, as
+       uf-stats takes little time on an assembly, and per job overhead adds
+       up over hundreds of assemblies.'''
 
     def start(self, fastas):
         if self.state == Task.State.STARTED:
-            for fid, fa in fastas.items():
-
-                # Cater for either gzipped or plain input using shell succinctness
-                cmd = "(gzip -dc '%s' 2>/dev/null || cat '%s') | uf | uf-stats -t" % (fa,fa) 
-                job_spec = JobSpec('sh', [ '-c', cmd, 'uf-stats' ], MAX_CPU, MAX_MEM, MAX_TIM)
-
-                # We add the fid as userdata, so we can use it in collect_output
-                self.store_job_spec(job_spec.as_dict())
-                self.add_job('uf-stats-%s' % fid, job_spec, '%s/%s' % (self.sid, fid), fid)
-
-    def collect_job(self, results, job, fid):
-        try:
-            with open(job.stdout) as f:
-                results[fid] = dict((r[0], r[1].strip()) for r in map(lambda l: l.split('\t'), f) if len(r) == 2)
-        except Exception as e:
-            self.fail("failed to process job output (%s): %s", job.stdout, str(e))
-
+            items = list(fastas.items())
+            n_jobs = max(1, min(len(items), int(self._scheduler.max_cpu // MAX_CPU)))
+            for i in range(n_jobs):
+                chunk = items[i::n_jobs]
+
+                # The j-th fasta's stats go to j.tsv in the job directory, so no fid
+                # ends up in the shell command; the job always exits 0, so that
+                # collect_job reports failures per fid from the tsvs
+                cmd = '; '.join("%s | uf-stats -t >%d.tsv" % (self.uf_cmd(fa), j) for j, (_, fa) in enumerate(chunk)) + '; true'
+                job_spec = JobSpec('sh', [ '-c', cmd, 'uf-stats' ], MAX_CPU, MAX_MEM, MAX_TIM * len(chunk))
+
+                # We add the fids as userdata, so we can use them in collect_job
+                self.add_job_spec('uf-stats-%d' % i, job_spec.as_dict())
+                self.add_job('uf-stats-%d' % i, job_spec, '%s/%d' % (self.sid, i), [ fid for fid, _ in chunk ])
+
+    @staticmethod
+    def uf_cmd(fa):
+        '''Return the shell command that writes fa as unfasta to stdout.'''
+        # Decompress gzipped input with pigz, feed plain input to uf directly
+        if is_gzipped(fa):
+            return "pigz -dc %s | uf" % shlex.quote(fa)
+        else:
+            return "uf <%s" % shlex.quote(fa)
+
+    def collect_results(self, jobs):
+        '''Extends super to also collect the fids that a FAILED job (e.g. one
+           that timed out) completed, and to fail the execution if no fasta
+           produced stats, as the jobs themselves exit 0.'''
+        results = super().collect_results(jobs)
+        for job, fids in jobs:
+            if job.state == Job.State.FAILED:
+                self.collect_job(results, job, fids)
+        if not results:
+            self.fail('uf-stats produced no output for any fasta')
+        return results
+
+    def collect_job(self, results, job, fids):
+        for j, fid in enumerate(fids):
+            tsv = job.file_path('%d.tsv' % j)
+            try:
+                with open(tsv) as f:
+                    rows = [ l.split('\t') for l in f.read().splitlines() ]
+                res = { r[0]: r[1].strip() for r in rows if len(r) == 2 }
+            except FileNotFoundError:
+                res = None
+            except Exception as e:
+                self.fail("failed to process job output (%s): %s", tsv, str(e))
+                continue
+            if res:
+                results[fid] = res
+            else:
+                self.add_error('uf-stats produced no output for %s' % fid)
@@ -6,13 +6,28 @@
 import os, logging
 from pico.workflow.executor import Task
 from pico.jobcontrol.job import JobSpec, Job
-from .base import ServiceExecution, UserException
+from .base import ServiceExecution, MultiJobExecution, UserException
 from .versions import DEPS_VERSIONS
 from ..workflow import Services
 
 # Our service name and current backend version
 SERVICE, VERSION = "FastQC", DEPS_VERSIONS['fastqc']
 
+# FastQC 0.11 sizes its JVM heap at 250MB per thread (--memory is 0.12+)
+GB_PER_THREAD = 0.25
+
+# Resource parameters per job: cpu, memory, run time reqs (for one file)
+MAX_CPU = 1
+MAX_MEM = GB_PER_THREAD
+MAX_TIM = 15 * 60
+
+# The execution getter for the fastqs that each of our services processes
+FASTQ_GETTERS = {
+    Services.FASTQC:         ServiceExecution.get_input_fastqs,
+    Services.TRIMMED_FASTQC: ServiceExecution.get_trimmed_fastqs,
+    Services.CLEAN_FASTQC:   ServiceExecution.get_cleaned_fastqs
+}
+
 
 class FastQCShim:
     '''Service shim that executes the backend.'''
@@ -24,34 +39,13 @@ class FastQCShim:
 
          # Get the task parameters from the blackboard
         try:
-            fastqs = task.get_input_fastqs().values() if Services(sid) == Services.FASTQC else \
-                     task.get_trimmed_fastqs().values() if Services(sid) == Services.TRIMMED_FASTQC else \
-                     task.get_cleaned_fastqs().values() if Services(sid) == Services.CLEAN_FASTQC else \
-                     None
+            getter = FASTQ_GETTERS.get(Services(sid))
+            if getter is None: raise Exception('unknown service in FastQCShim: %s' % sid)
 
-            if fastqs is None: raise Exception('unknown service in FastQCShim: %s' % sid)
+            fastqs = getter(task)
             if not fastqs: raise UserException('no fastq files to process')
 
-            # Compute resources
-            n_fq = len(fastqs)
-            max_par = int(task._scheduler.max_mem * 4)    # each thread needs 250MB
-            cpu = min(task._scheduler.max_cpu, len(fastqs), max_par)
-            mem = cpu / 4               # each job 250M
-            tim = n_fq / cpu * 15 * 60   # each job at most 15 min
-
-            # Set up parameters
-            params = [
-                '--outdir', '.',
-                '--noextract',
-                '--quiet',
-                '--threads', cpu
-            ]
-
-            params.extend(fastqs)
-
-            job_spec = JobSpec('fastqc', params, cpu, mem, tim)
-            task.store_job_spec(job_spec.as_dict())
-            task.start(job_spec)
+            task.start(fastqs)
 
         # Failing inputs will throw UserException
         except UserException as e:
@@ -66,31 +60,46 @@ class FastQCShim:
 
 
 # Single execution of the service
-class FastQCExecution(ServiceExecution):
-    '''A single execution of the Quast service'''
+class FastQCExecution(MultiJobExecution):
+    '''A single execution of the FastQC service.  Runs one single-threaded
+       job per fastq, so that the scheduler can spread the files over all
+       free slots, and a slow file does not hold up the others.'''
 
-    _job = None
+    _failed = False
 
-    def start(self, job_spec):
+    def start(self, fastqs):
         if self.state == Task.State.STARTED:
-            self._job = self._scheduler.schedule_job('fastqc-%s' % self.sid, job_spec, self.sid)
-
-    def collect_output(self, job):
-        '''Collect the job output and put on blackboard.
-           This method is called by super().report() once job is done.'''
+            for fid, fq in sorted(fastqs.items()):
+                params = [
+                    '--outdir', '.',
+                    '--noextract',
+                    '--quiet',
+                    fq
+                ]
+                job_spec = JobSpec('fastqc', params, MAX_CPU, MAX_MEM, MAX_TIM)
+
+                # We add the fid as userdata, so we can use it in collect_job
+                self.add_job_spec('fastqc-%s' % fid, job_spec.as_dict())
+                self.add_job('fastqc-%s-%s' % (self.sid, fid), job_spec, '%s/%s' % (self.sid, fid), fid)
+
+    def collect_results(self, jobs):
+        '''Extends super to fail the execution once if any job wrote errors.'''
+        results = super().collect_results(jobs)
+        if self._failed:
+            self.fail('FastQC reported errors')
+        return results
+
+    def collect_job(self, results, job, fid):
+        '''Collect the output path of the job for fid into results.'''
 
         # In all cases, store FastQC output path
-        self.store_results(dict(output_path = job.file_path("")))
+        results[fid] = job.file_path("")
 
         # FastQC doesn't report errors using its exit code (sigh), so read its stderr
         try:
-            fail = False
-            with open(job.stderr, 'r') as f:
-                for l in f:
-                    fail = True
-                    self.add_error('fastqc: %s' % l.strip())
-            if fail:
-                self.fail('FastQC reported errors')
+            for l in self.read_stderr(job):
+                self._failed = True
+                self.add_error('fastqc: %s: %s' % (fid, l))
 
         except Exception as e:
             self.fail("failed to parse error output (%s): %s" % (job.stderr, str(e)))
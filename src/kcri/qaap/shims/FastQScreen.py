@@ -3,7 +3,7 @@
 # kcri.qaap.shims.FastQScreen - implements the FastQScreenShim
 #
 
-import os, logging, tempfile
+import os, logging, tempfile, weakref
 from pico.workflow.executor import Task
 from pico.jobcontrol.job import JobSpec, Job
 from .base import ServiceExecution, UserException
@@ -13,6 +13,15 @@ from ..workflow import Services
 # Our service name and current backend version
 SERVICE, VERSION = "FastQScreen", DEPS_VERSIONS['fastq-screen']
 
+# Directory for the generated config file, preferably memory-backed
+CONFIG_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# The execution getter for the fastqs that each of our services processes
+FASTQ_GETTERS = {
+    Services.FASTQSCREEN:       ServiceExecution.get_input_fastqs,
+    Services.CLEAN_FASTQSCREEN: ServiceExecution.get_cleaned_fastqs
+}
+
 
 class FastQScreenShim:
     '''Service shim that executes the backend.'''
@@ -24,38 +33,41 @@ class FastQScreenShim:
 
          # Get the task parameters from the blackboard
         try:
-            fastqs = task.get_input_fastqs().values() if Services(sid) == Services.FASTQSCREEN else \
-                     task.get_cleaned_fastqs().values() if Services(sid) == Services.CLEAN_FASTQSCREEN else \
-                     None
+            getter = FASTQ_GETTERS.get(Services(sid))
+            if getter is None: raise Exception('unknown service in FastQScreenShim: %s' % sid)
 
-            if fastqs is None: raise Exception('unknown ident in FastQScreenShim: %s' % sid.value)
+            fastqs = getter(task)
             if not fastqs: raise UserException('no fastq files to process')
 
+            # Sorted list of paths, so the job arguments are reproducible
+            fastqs = sorted(fastqs.values())
+
             # Compute resources
             n_fq = len(fastqs)
             max_par = int(task._scheduler.max_mem * 4)    # each thread needs 250MB
-            cpu = min(task._scheduler.max_cpu, len(fastqs), max_par)
+            cpu = min(task._scheduler.max_cpu, n_fq, max_par)
             mem = cpu / 4               # each job 250M
             tim = n_fq / cpu * 60 * 60   # each job at most 60 min
 
-            # Retrieve the screening databases
-            dbs = task.get_screening_dbs()
+            # Write the config file with the screening databases
+            cfg = task.write_config(task.get_screening_dbs())
 
             # Set up parameters
             params = [
-                '--conf', '@PLACEHOLDER@',
-                '--subset', 0,
+                '--conf', cfg,
+                '--aligner', 'bowtie2',     # our screening dbs are bowtie2 indexes
+                '--subset', '0',
                 '--outdir', '.',
                 '--force',
                 '--quiet',
-                '--threads', cpu
+                '--threads', str(cpu)
             ]
 
             params.extend(fastqs)
 
             job_spec = JobSpec('fastq_screen', params, cpu, mem, tim)
             task.store_job_spec(job_spec.as_dict())
-            task.start(job_spec, dbs)
+            task.start(job_spec)
 
         # Failing inputs will throw UserException
         except UserException as e:
@@ -74,41 +86,40 @@ class FastQScreenExecution(ServiceExecution):
     '''A single execution of the service'''
 
     _job = None
+    _cfg = None
 
-    def start(self, job_spec, dbs):
-        if self.state == Task.State.STARTED:
-
-            # Generate the FastQScreen config file with the DB paths
-            cfg = tempfile.NamedTemporaryFile(mode='w', delete=False)
-            for i,db in self.get_screening_dbs().items():
-                print('DATABASE\t%s\t%s' % (i,db), file=cfg)
-            cfg.close()
-
-            # Put the path to the config file in the parameters
-            self._cfg = cfg.name
-            job_spec.args[1] = self._cfg
+    def write_config(self, dbs):
+        '''Write the FastQScreen config file listing dbs, return its path.
+           The file is removed when the job is collected, or else when this
+           execution is garbage collected.'''
+        fd, path = tempfile.mkstemp(prefix='fqs-', suffix='.conf', dir=CONFIG_DIR)
+        try:
+            os.write(fd, b''.join(b'DATABASE\t%b\t%b\n' % (i.encode(), db.encode()) for i,db in dbs.items()))
+        finally:
+            os.close(fd)
+        self._cfg = weakref.finalize(self, os.unlink, path)
+        return path
 
+    def start(self, job_spec):
+        if self.state == Task.State.STARTED:
             self._job = self._scheduler.schedule_job('fastq-screen-%s' % self.sid, job_spec, self.sid)
 
-
     def collect_output(self, job):
         '''Collect the job output and put on blackboard.
            This method is called by super().report() once job is done.'''
 
         # Clean up the config file
-        os.unlink(job.spec.args[1])
+        self._cfg()
 
         # In all cases, store FastQScreen output path
         self.store_results(dict(output_path = job.file_path("")))
 
         # FastQScreen doesn't report errors using its exit code (sigh), so read its stderr
         try:
-            fail = False
-            with open(job.stderr, 'r') as f:
-                for l in f:
-                    fail = True
-                    self.add_error('fastq-screen: %s' % l.strip())
-            if fail:
+            errors = self.read_stderr(job)
+            for l in errors:
+                self.add_error('fastq-screen: %s' % l)
+            if errors:
                 self.fail('FastQScreen reported errors')
 
         except Exception as e:
@@ -27,10 +27,12 @@ class InterOpShim:
             d = blackboard.get_illumina_run_dir()
             if not d: raise UserException('no Illumina run output directory found')
 
-            # Set up job
-            cmd = "interop_summary --csv=1 '%s' >summary.csv && interop_index-summary --csv=1 '%s' >index-summary.csv" % (d,d)
+            # Set up job, running the two parsers side by side, and failing if either fails
+            cmd = "interop_summary --csv=1 '%s' >summary.csv & P=$!; " \
+                  "interop_index-summary --csv=1 '%s' >index-summary.csv; R=$?; " \
+                  "wait $P && exit $R" % (d,d)
 
-            job_spec = JobSpec('sh', [ '-c', cmd, 'interop' ], 1, 1, 10*60)
+            job_spec = JobSpec('sh', [ '-c', cmd, 'interop' ], 2, 1, 10*60)
             task.store_job_spec(job_spec.as_dict())
             task.start(job_spec)
 
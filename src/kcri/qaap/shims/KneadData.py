@@ -3,11 +3,12 @@
 # kcri.qaap.shims.KneadData - service shim to the KneadData backend
 #
 
-import os, logging, functools, operator, re
+import os, logging
 from pico.workflow.executor import Task
 from pico.jobcontrol.job import JobSpec, Job
-from .base import MultiJobExecution, UserException
+from .base import MultiJobExecution, UserException, nonz_file
 from .versions import DEPS_VERSIONS
+from .TrimGalore import report_filter
 
 # Our service name and current backend version
 SERVICE, VERSION = "KneadData", DEPS_VERSIONS['kneaddata']
@@ -61,8 +62,8 @@ class KneadDataExecution(MultiJobExecution):
     def start(self, pe_fqs, se_fqs):
         if self.state == Task.State.STARTED:
 
-            # Retrieve the clean databases
-            dbs = self.get_cleaning_dbs()
+            # Retrieve the clean databases, resolving their paths once for all jobs
+            dbs = [ os.path.abspath(db) for db in self.get_cleaning_dbs() ]
 
             # Compute max requestable threads
             gb_per_thr = 0.250
@@ -84,7 +85,7 @@ class KneadDataExecution(MultiJobExecution):
 
         params = [ '-i1', fq1, '-i2', fq2, '--output-prefix', fid, '-o', '.', '-t', cpu, '--max-memory', '%.1fG' % mem, '--bypass-trim' ]
         if not self._blackboard.get_user_input('cl_t', False): params.append('--bypass-trf')
-        for db in dbs: params += [ '-db', os.path.abspath(db) ]
+        for db in dbs: params += [ '-db', db ]
 
           #'--fastqc', 'fastqc', '--trf', 'trf', '--run-trim-repetitive' ]
           #--output-prefix OUTPUT_PREFIX
@@ -124,7 +125,7 @@ class KneadDataExecution(MultiJobExecution):
 
         params = [ '-un', fq, '--output-prefix', fid, '-o', '.', '-t', cpu, '--max-memory', '%.1fG' % mem, '--bypass-trim' ]
         if not self._blackboard.get_user_input('cl_t', False): params.append('--bypass-trf')
-        for db in dbs: params += [ '-db', os.path.abspath(db) ]
+        for db in dbs: params += [ '-db', db ]
 
         job_spec = JobSpec('kneaddata', params, cpu, mem, MAX_TIM)
         self.add_job_spec('se/%s' % fid, job_spec.as_dict())
@@ -139,8 +140,6 @@ class KneadDataExecution(MultiJobExecution):
         res = dict()
         res['summary'] = self.collect_summary(job, is_pe, fid)
 
-        nonz_file = lambda f: f if os.path.isfile(f) and os.path.getsize(f) != 0 else None
-
         # TODO: undo the KneadData mangling of the Illumina fastq headers
         # sed -i -Ee 's,^(@.*)(:N:0:20)#0/(.)$,\1 \3\2,' path-to-fastq
 
@@ -152,49 +151,16 @@ class KneadDataExecution(MultiJobExecution):
 
             res['fastqs'] = fqs
             self._blackboard.add_cleaned_pe_quad(fid, fqs)
-
-            bag = results.get('pe', dict())
-            bag[fid] = res
-            results['pe'] = bag
         else:
             fq = nonz_file(job.file_path(fid + '.fastq'))
             res['fastq'] = fq
             if fq: self._blackboard.add_cleaned_se_fq(fid, fq)
 
-        bag = results.get('pe' if is_pe else 'se', dict())  # cater for when there is one already
-        bag[fid] = res
-        results['pe' if is_pe else 'se'] = bag
-
-    # Output parsing magic below ...
-
-    to_int = lambda x: int(x.replace(',',''))
-    to_str = lambda x: str(x)
-
-    PATTERNS = dict({
-        'total_reads':   (re.compile('^Total reads processed: +([0-9,]+)$'), to_int),
-        'adapter_reads': (re.compile('^Reads with adapters: +([0-9,]+) .*$'), to_int),
-        'passing_reads': (re.compile('^Reads written \\(passing filters\\): +([0-9,]+) .*$'), to_int),
-        'total_bp':      (re.compile('^Total basepairs processed: +([0-9,]+) bp$'), to_int),
-        'trimmed_bp':    (re.compile('^Quality-trimmed: +([0-9,]+) bp .*$'), to_int),
-        'passing_bp':    (re.compile('^Total written \\(filtered\\): +([0-9,]+) bp .*$'), to_int),
-        'adapter':       (re.compile('^Using (.+) adapter for trimming \(count: [0-9,]+\)\. .*$'), to_str),
-        'adapter_seq':   (re.compile('^Adapter sequence: \'([ACTG]+)\'.*$'), to_str),
-        # Beware, suddenly the space between : and value is a tab so allow any space 
-        'removed_seqs':  (re.compile('^Sequences removed because they became shorter than the length cutoff of [0-9]+ bp:\\s+([0-9,]+) .*$'), to_int),
-        'removed_pairs': (re.compile('^Number of sequence pairs removed because at least one read was shorter than the length cutoff \\([0-9]+ bp\\):\\s+([0-9,]+) .*$'), to_int)
-        })
-
-    @staticmethod
-    def report_filter(l): # note l has the '\n' still on, silly Python
-        for k,m,f in [ (k, p.fullmatch(l[:-1]), f) for k,(p,f) in TrimGaloreExecution.PATTERNS.items() ]:
-            if m:
-                try: return k, f(m.group(1))
-                except: return k, '?'
-        return None
+        results.setdefault('pe' if is_pe else 'se', dict())[fid] = res
 
     def extract_summary(self, fn):
         with open(fn, 'r') as f:
-            return dict(filter(None, map(self.report_filter, f)))
+            return dict(filter(None, map(report_filter, f)))
 
     def collect_summary(self, job, is_pe, fid):
         d = dict(TODO_summary = 'TODO')
@@ -91,7 +91,8 @@ class QuastShim:
         return task
 
 
-translate = dict({
+# Translation of the Quast report row names to our metrics keys
+_TRANSLATE = dict({
     'Assembly'                      : 'sample',
     '# contigs'                     : 'num_ctg',
     'Largest contig'                : 'max_ctg',
@@ -172,12 +173,10 @@ class QuastExecution(ServiceExecution):
 
         tsv = job.file_path('report.tsv')
         try:
-            metrics = dict()
-
             with open(tsv, newline='') as f:
-                reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
-                for row in reader:
-                    metrics[translate.get(row[0], row[0])] = row[1]
+                reader = csv.reader(f, dialect='excel-tab', quoting=csv.QUOTE_NONE)
+                xl = _TRANSLATE.get
+                metrics = { xl(row[0], row[0]): row[1] for row in reader }
 
             self.store_results({
                 'contig_threshold': self.get_user_input('qu_t'),
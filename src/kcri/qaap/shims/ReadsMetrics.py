@@ -3,12 +3,13 @@
 # kcri.qaap.shims.ReadsMetrics - service shim to the fastq-stats backend
 #
 
-import os, logging
+import os, shutil, logging
 from pico.workflow.executor import Task
 from pico.jobcontrol.job import JobSpec, Job
-from .base import MultiJobExecution, UserException
+from .base import ServiceExecution, MultiJobExecution, UserException
 from .versions import DEPS_VERSIONS
 from ..workflow import Services
+from ..filescan import is_gzipped
 
 # Our service name and current backend version
 SERVICE, VERSION = "ReadsMetrics", DEPS_VERSIONS['fastq-utils']
@@ -18,6 +19,19 @@ MAX_CPU = 2
 MAX_MEM = 0.01
 MAX_TIM = 5 * 60
 
+# Decompression of gzipped fastqs: rapidgzip (installed in the image) does
+# this in parallel using at most GZ_THREADS; pigz is the fallback without it
+HAVE_RAPIDGZIP = shutil.which('rapidgzip') is not None
+GZ_THREADS = 4
+GZ_MEM = 0.25 if HAVE_RAPIDGZIP else MAX_MEM
+
+# The execution getter for the fastqs that each of our services processes
+FASTQ_GETTERS = {
+    Services.READSMETRICS:         ServiceExecution.get_input_fastqs,
+    Services.TRIMMED_READSMETRICS: ServiceExecution.get_trimmed_fastqs,
+    Services.CLEAN_READSMETRICS:   ServiceExecution.get_cleaned_fastqs
+}
+
 # The Service shim class
 class ReadsMetricsShim:
     '''Service shim that executes the backend.'''
@@ -29,12 +43,10 @@ class ReadsMetricsShim:
 
         # From here we catch exception and task will FAIL
         try:
-            fastqs = task.get_input_fastqs() if Services(sid) == Services.READSMETRICS else \
-                     task.get_trimmed_fastqs() if Services(sid) == Services.TRIMMED_READSMETRICS else \
-                     task.get_cleaned_fastqs() if Services(sid) == Services.CLEAN_READSMETRICS else \
-                     None
+            getter = FASTQ_GETTERS.get(Services(sid))
+            if getter is None: raise Exception('unknown service in ReadsMetricsShim: %s' % sid)
 
-            if fastqs is None: raise Exception('unknown service in ReadsMetricsShim: %s' % sid)
+            fastqs = getter(task)
             if not fastqs: raise UserException('no fastq files to process')
 
             task.start(fastqs)
@@ -57,11 +69,24 @@ class ReadsMetricsExecution(MultiJobExecution):
 
     def start(self, fastqs):
         if self.state == Task.State.STARTED:
+
+            # Decompressor command and cpu request for the gzipped fastqs: the
+            # rapidgzip threads plus one for fastq-stats, within max_cpu
+            if HAVE_RAPIDGZIP:
+                max_cpu = self._scheduler.max_cpu
+                gz_thr = max(1, min(max_cpu - 1, GZ_THREADS))
+                gz_cmd, gz_cpu = 'rapidgzip -P %d -d -c' % gz_thr, min(max_cpu, gz_thr + 1)
+            else:
+                gz_cmd, gz_cpu = 'pigz -dc', MAX_CPU
+
             for fid, fpath in fastqs.items():
 
-                # We use shell succinctness to cater for either gzipped or plain input
-                cmd = "(gzip -dc '%s' 2>/dev/null || cat '%s') | fastq-stats" % (fpath,fpath) 
-                job_spec = JobSpec('sh', [ '-c', cmd, 'fastq-stats' ], MAX_CPU, MAX_MEM, MAX_TIM)
+                # Decompress gzipped input through a pipe, pass plain input directly
+                if is_gzipped(fpath):
+                    cmd = "%s '%s' | fastq-stats" % (gz_cmd, fpath)
+                    job_spec = JobSpec('sh', [ '-c', cmd, 'fastq-stats' ], gz_cpu, GZ_MEM, MAX_TIM)
+                else:
+                    job_spec = JobSpec('fastq-stats', [ fpath ], MAX_CPU, MAX_MEM, MAX_TIM)
 
                 # Don't log the job spec, fastq-stats is trivial enough
                 #self.put_job_spec(job_spec.as_dict())
@@ -69,18 +94,14 @@ class ReadsMetricsExecution(MultiJobExecution):
                 # Add the fid as userdata, so we can use it in collect_output
                 self.add_job('fastq-stats-%s' % fid, job_spec, '%s/%s' % (self.sid, fid), fid)
 
-    @staticmethod
-    def parse_line(line):
-        l = line.strip().split('\t')
-        return (l[0],
-                int(l[1]) if l[0].startswith('n_') else 
-                float(l[1]) if l[0].startswith('pct_') else 
-                l[1])
-
     def collect_job(self, results, job, fid):
         try:
+            res = dict()
             with open(job.stdout) as f:
-                results[fid] = dict(map(self.parse_line, f))
+                for l in f:
+                    k, _, v = l.strip().partition('\t')
+                    if k:
+                        res[k] = int(v) if k.startswith('n_') else float(v) if k.startswith('pct_') else v
+            results[fid] = res
         except Exception as e:
             self.fail("failed to process job output (%s): %s", job.stdout, str(e))
-
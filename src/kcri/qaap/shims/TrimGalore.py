@@ -3,10 +3,10 @@
 # kcri.qaap.shims.TrimGalore - service shim to the TrimGalore backend
 #
 
-import os, logging, functools, operator, re
+import os, logging, re
 from pico.workflow.executor import Task
 from pico.jobcontrol.job import JobSpec, Job
-from .base import MultiJobExecution, UserException
+from .base import MultiJobExecution, UserException, nonz_file
 from .versions import DEPS_VERSIONS
 
 # Our service name and current backend version
@@ -43,6 +43,36 @@ class TrimGaloreShim:
         return task
 
 
+# Output parsing magic for report_filter below, shared with KneadData ...
+
+_to_int = lambda x: int(x.replace(',',''))
+_to_str = lambda x: str(x)
+
+# Report line patterns as (key, prefix, regex, converter), tried in order until
+# one matches; the regex is run only on lines that start with the literal prefix
+_PATTERNS = (
+    ('total_reads', 'Total reads processed:', re.compile(r'^Total reads processed: +([0-9,]+)$'), _to_int),
+    ('adapter_reads', 'Reads with adapters:', re.compile(r'^Reads with adapters: +([0-9,]+) '), _to_int),
+    ('passing_reads', 'Reads written (passing filters):', re.compile(r'^Reads written \(passing filters\): +([0-9,]+) '), _to_int),
+    ('total_bp', 'Total basepairs processed:', re.compile(r'^Total basepairs processed: +([0-9,]+) bp$'), _to_int),
+    ('trimmed_bp', 'Quality-trimmed:', re.compile(r'^Quality-trimmed: +([0-9,]+) bp '), _to_int),
+    ('passing_bp', 'Total written (filtered):', re.compile(r'^Total written \(filtered\): +([0-9,]+) bp '), _to_int),
+    ('adapter', 'Using ', re.compile(r'^Using (.+) adapter for trimming \(count: [0-9,]+\)\. '), _to_str),
+    ('adapter_seq', 'Adapter sequence:', re.compile(r"^Adapter sequence: '([ACTG]+)'"), _to_str),
+    # Beware, suddenly the space between : and value is a tab so allow any space 
+    ('removed_seqs', 'Sequences removed because', re.compile(r'^Sequences removed because they became shorter than the length cutoff of [0-9]+ bp:\s+([0-9,]+) '), _to_int),
+    ('removed_pairs', 'Number of sequence pairs removed', re.compile(r'^Number of sequence pairs removed because at least one read was shorter than the length cutoff \([0-9]+ bp\):\s+([0-9,]+) '), _to_int)
+)
+
+def report_filter(l): # note l has the '\n' still on, silly Python
+    for k,x,p,f in _PATTERNS:
+        m = l.startswith(x) and p.match(l)
+        if m:
+            try: return k, f(m.group(1))
+            except: return k, '?'
+    return None
+
+
 # Single execution of the service
 class TrimGaloreExecution(MultiJobExecution):
     '''A single execution of the service, returned by execute().
@@ -109,57 +139,23 @@ class TrimGaloreExecution(MultiJobExecution):
         res['summary'] = self.collect_summary(job, is_pe, fid)
 
         if is_pe:
-            check_file = lambda f: None if not os.path.exists(f) or os.stat(f).st_size == 0 else f
             fastqs = (
                     job.file_path(fid + '_val_1.fq'),
                     job.file_path(fid + '_val_2.fq'),
-                    check_file(job.file_path(fid + '_R1_unpaired_1.fq')),
-                    check_file(job.file_path(fid + '_R2_unpaired_2.fq')) )
+                    nonz_file(job.file_path(fid + '_R1_unpaired_1.fq')),
+                    nonz_file(job.file_path(fid + '_R2_unpaired_2.fq')) )
             res['fastqs'] = fastqs
             self._blackboard.add_trimmed_pe_quad(fid, fastqs)
-
-            bag = results.get('pe', dict())
-            bag[fid] = res
-            results['pe'] = bag
         else:
             fq = job.file_path(fid + '_trimmed.fq')
             res['fastq'] = fq
             self._blackboard.add_trimmed_se_fq(fid, fq)
 
-        bag = results.get('pe' if is_pe else 'se', dict())  # cater for when there is one already
-        bag[fid] = res
-        results['pe' if is_pe else 'se'] = bag
-
-    # Output parsing magic below ...
-
-    to_int = lambda x: int(x.replace(',',''))
-    to_str = lambda x: str(x)
-
-    PATTERNS = dict({
-        'total_reads':   (re.compile('^Total reads processed: +([0-9,]+)$'), to_int),
-        'adapter_reads': (re.compile('^Reads with adapters: +([0-9,]+) .*$'), to_int),
-        'passing_reads': (re.compile('^Reads written \\(passing filters\\): +([0-9,]+) .*$'), to_int),
-        'total_bp':      (re.compile('^Total basepairs processed: +([0-9,]+) bp$'), to_int),
-        'trimmed_bp':    (re.compile('^Quality-trimmed: +([0-9,]+) bp .*$'), to_int),
-        'passing_bp':    (re.compile('^Total written \\(filtered\\): +([0-9,]+) bp .*$'), to_int),
-        'adapter':       (re.compile('^Using (.+) adapter for trimming \(count: [0-9,]+\)\. .*$'), to_str),
-        'adapter_seq':   (re.compile('^Adapter sequence: \'([ACTG]+)\'.*$'), to_str),
-        # Beware, suddenly the space between : and value is a tab so allow any space 
-        'removed_seqs':  (re.compile('^Sequences removed because they became shorter than the length cutoff of [0-9]+ bp:\\s+([0-9,]+) .*$'), to_int),
-        'removed_pairs': (re.compile('^Number of sequence pairs removed because at least one read was shorter than the length cutoff \\([0-9]+ bp\\):\\s+([0-9,]+) .*$'), to_int)
-        })
-
-    @staticmethod
-    def report_filter(l): # note l has the '\n' still on, silly Python
-        for k,m,f in [ (k, p.fullmatch(l[:-1]), f) for k,(p,f) in TrimGaloreExecution.PATTERNS.items() ]:
-            if m:
-                try: return k, f(m.group(1))
-                except: return k, '?'
-        return None
+        results.setdefault('pe' if is_pe else 'se', dict())[fid] = res
 
     def extract_summary(self, fn):
         with open(fn, 'r') as f:
-            return dict(filter(None, map(self.report_filter, f)))
+            return dict(filter(None, map(report_filter, f)))
 
     def collect_summary(self, job, is_pe, fid):
         d = dict()
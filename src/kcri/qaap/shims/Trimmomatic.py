@@ -3,7 +3,7 @@
 # kcri.qaap.shims.Trimmomatic - service shim to the Trimmomatic backend
 #
 
-import os, logging, functools, operator
+import os, logging
 from pico.workflow.executor import Task
 from pico.jobcontrol.job import JobSpec, Job
 from .base import MultiJobExecution, UserException
@@ -109,15 +109,11 @@ class TrimmomaticExecution(MultiJobExecution):
             result['summary'] = dict(map(self.parse_line, f))
 
         if len(udata) == 5:     # paired end
-            bag = results.get('pe', dict())
             result['paired'] = [job.file_path(udata[1]), job.file_path(udata[3])]
             result['unpaired'] = list(filter(lambda f: os.stat(f).st_size != 0, [job.file_path(udata[2]), job.file_path(udata[4])]))
-            bag[fid] = result
-            results['pe'] = bag
+            results.setdefault('pe', dict())[fid] = result
 
         else: # len(udata) == 2: # single
-            bag = results.get('se', dict())
             result['fastq'] = job.file_path(udata[1])
-            bag[fid] = result
-            results['se'] = bag
+            results.setdefault('se', dict())[fid] = result
 
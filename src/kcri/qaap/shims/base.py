@@ -2,7 +2,8 @@
 #
 # kcri.qaap.shims.base - base functionality across all service shims
 #
-#   This module defines ServiceExecution and UnimplementedService.
+#   This module defines ServiceExecution, MultiJobExecution, UnimplementedService,
+#   and the nonz_file helper.
 #
 
 import os, logging
@@ -21,6 +22,17 @@ class UserException(Exception):
         super().__init__(message % args)
 
 
+### function nonz_file
+#
+#   Returns path f if it is a non-empty file, else None, using a single stat.
+
+def nonz_file(f):
+    try:
+        return f if os.stat(f).st_size != 0 else None
+    except OSError:
+        return None
+
+
 ### class ServiceExecution
 #
 #   Base class for the task executions returned by all QAAP Service shims.
@@ -83,6 +95,18 @@ class ServiceExecution(Task):
         '''Add errmsg to the list of errors of the service.'''
         self._blackboard.append_to('services/%s/%s' % (self.sid, 'errors'), errmsg)
 
+    def read_stderr(self, job):
+        '''Return the non-empty lines on job's stderr.  Checks its size first,
+           as in the common case stderr is empty (or was never created).'''
+        try:
+            if os.stat(job.stderr).st_size == 0:
+                return []
+        except FileNotFoundError:
+            return []
+        with open(job.stderr, 'rb') as f:
+            lines = f.read().decode(errors='replace').splitlines()
+        return [ l.strip() for l in lines if l.strip() ]
+
     def store_job_spec(self, jobspec):
         '''Store the service parameters for a one-job service on the blackboard.'''
         self.put_task_info('job', jobspec)
@@ -14,7 +14,7 @@ AUTHOR = 'Marco van Zwetselaar'
 PLATFORMS = [ 'Linux' ]
 REQUIRES_PYTHON = '>=3.8.0'
 REQUIRED = ['picoline' ]
-EXTRAS = { }
+EXTRAS = { 'orjson': ['orjson'] }
 
 about = {'__version__': VERSION}
 